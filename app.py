@@ -1,191 +1,352 @@
 import os
+import re
 import time
+import shutil
+import hashlib
+import tempfile
 import subprocess
-from graphviz import Digraph
-from flask import Flask, request, jsonify, render_template
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+import orjson
+from graphviz import Source
+from flask import Flask, Response, request, render_template, send_from_directory, abort
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
+# Largest source accepted for analysis, in characters (not bytes); the analysis
+# and render paths are tuned for programs well under this size
+MAX_CODE_LENGTH = 256 * 1024
+# Leave room for UTF-8 and JSON escaping when bounding the request body itself
+app.config["MAX_CONTENT_LENGTH"] = 4 * MAX_CODE_LENGTH
+# Unpaired surrogates survive JSON parsing but cannot be encoded as UTF-8
+SURROGATE_PATTERN = re.compile('[\ud800-\udfff]')
+
+# Single-character tokens that lexical analysis accepts besides alphanumerics
+VALID_OPERATORS = frozenset('+-*/=(){};')
+
+# Brackets are the only characters the syntax scan visits
+BRACKET_PATTERN = re.compile(r'[{}()\[\]]')
+MATCHING_OPEN = {')': '(', '}': '{', ']': '['}
+SYNTAX_MESSAGES = {
+    'unmatched_close': "Unmatched closing '{0}' at position {1}",
+    'mismatched': "Mismatched '{0}' and '{1}' at position {2}",
+    'unmatched_open': "Unmatched opening '{0}' at position {1}",
+}
+
+# Whole-word loop keywords, so identifiers like "format" are not counted
+LOOP_PATTERN = re.compile(r'\b(?:for|while)\b')
+
+# Student programs are short-lived, so trade peak JIT performance for a faster
+# JVM start. Stack and heap are capped so one submission cannot starve the others;
+# the caps only apply to running the program, never to javac.
+JVM_FLAGS = ["-XX:TieredStopAtLevel=1", "-Xss512k", "-Xmx64m"]
+# javac is itself a short-lived JVM, so it gets the same startup trade-off but
+# keeps the default heap and stack for large or deeply nested sources
+JAVAC_FLAGS = ["-J-XX:TieredStopAtLevel=1"]
+# Seconds javac may take before the submission is reported as a compile failure
+COMPILE_TIMEOUT = 30
+# Seconds a submission may run before it is killed
+JAVA_TIMEOUT = 5
+# Keep per-request Java sources on tmpfs when the host has one
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Analysis results are cached only for sources up to this many characters, so
+# the cache holds at most ANALYSIS_CACHE_SIZE small entries
+ANALYSIS_CACHE_SIZE = 64
+ANALYSIS_CACHE_MAX_LENGTH = 32 * 1024
+
+# The browser draws the AST from JSON; Graphviz only runs when an image is
+# downloaded, so recent ASTs are kept by source hash until then. This store is
+# per process: under a multi-process server a download that reaches another
+# worker finds no AST and returns 404 unless the image was already rendered.
+RECENT_ASTS = OrderedDict()
+RECENT_ASTS_LIMIT = 64
+# Total AST nodes kept across RECENT_ASTS, so a few huge sources cannot pin memory
+RECENT_ASTS_MAX_NODES = 100_000
+RECENT_ASTS_LOCK = threading.Lock()
+SOURCE_HASH_PATTERN = re.compile(r'[0-9a-f]{16}')
+# SVG skips rasterization entirely; PNG stays available on request
+AST_IMAGE_FORMATS = ("svg", "png")
+
 
 @app.route("/")
 def home():
     print("Looking for index.html in:", app.template_folder)
     return render_template("index.html")
 
-# ---------- Lexical Analysis ----------
-def lexical_analysis(code):
-    start_time = time.time()
-    tokens = code.split()
-    token_count = {token: tokens.count(token) for token in set(tokens)}
-    invalid_tokens = [
-        token for token in tokens
-        if not token.isalnum() and token not in ['+', '-', '*', '/', '=', '(', ')', '{', '}', ';']
-    ]
-    lexical_time = time.time() - start_time
-    return token_count, invalid_tokens, lexical_time
-
-# ---------- Syntax Analysis ----------
-def syntax_analysis(code):
-    start_time = time.time()
+# ---------- Bracket Scanner ----------
+def scan_brackets(code):
+    # The regex engine skips everything but brackets, so the Python loop
+    # below runs once per bracket rather than once per character
     stack = []
-    errors = []
+    problems = []
 
-    for i, char in enumerate(code):
-        if char in "{([":  
-            stack.append((char, i))
-        elif char in "})]":
+    for match in BRACKET_PATTERN.finditer(code):
+        char = match.group()
+        if char in MATCHING_OPEN:
             if not stack:
-                errors.append(f"Unmatched closing '{char}' at position {i}")
+                problems.append(('unmatched_close', char, match.start()))
             else:
                 last_open, _ = stack.pop()
-                if not ((last_open == '(' and char == ')') or
-                        (last_open == '{' and char == '}') or
-                        (last_open == '[' and char == ']')):
-                    errors.append(f"Mismatched '{last_open}' and '{char}' at position {i}")
-
-    if stack:
-        for char, pos in stack:
-            errors.append(f"Unmatched opening '{char}' at position {pos}")
-
-    if ";" not in code:
-        errors.append("Missing semicolon in the code.")
-
-    syntax_time = time.time() - start_time
-    return "Incorrect" if errors else "Correct", errors, syntax_time
-
-# ---------- Execute Java Code ----------
-def execute_java_code(java_code, file_name="Main"):
-    java_file = f"{file_name}.java"
-    with open(java_file, "w") as f:
-        f.write(java_code)
-
-    try:
-        compile_result = subprocess.run(["javac", java_file], capture_output=True, text=True)
-        if compile_result.returncode != 0:
-            return "Compilation Error", compile_result.stderr
-
-        run_result = subprocess.run(["java", file_name], capture_output=True, text=True)
-        if run_result.returncode != 0:
-            return "Runtime Error", run_result.stderr
-
-        return "Execution Success", run_result.stdout
-    finally:
-        if os.path.exists(java_file):
-            os.remove(java_file)
-        if os.path.exists(f"{file_name}.class"):
-            os.remove(f"{file_name}.class")
-
-# ---------- Generate AST ----------
-def generate_ast(code):
-    ast = {'data': 'Root', 'children': []}
-    lines = code.splitlines()
-    current_node = ast
-    stack = []
+                if last_open != MATCHING_OPEN[char]:
+                    problems.append(('mismatched', last_open, char, match.start()))
+        else:
+            stack.append((char, match.start()))
+
+    for char, pos in stack:
+        problems.append(('unmatched_open', char, pos))
+
+    # Messages are only formatted once the scan is done, and only if needed
+    errors = [SYNTAX_MESSAGES[kind].format(*args) for kind, *args in problems]
+    return errors
+
+# ---------- Code Analysis ----------
+@dataclass(frozen=True)
+class AnalysisResult:
+    token_count: dict
+    invalid_tokens: list
+    syntax_result: str
+    syntax_errors: list
+    ast: dict
+    summary: list
+    suggestions: list
+    time_complexity: str
+
+def analyze_all(code):
+    # Lexical, syntax, AST, summary and loop analysis share one walk over the lines
+    # Lexical state
+    tokens = []
+
+    # Syntax runs as one scan over the whole buffer rather than per line
+    syntax_errors = scan_brackets(code)
+
+    # Single-character features are one C-level search of the whole source each
+    has_semicolon = ';' in code
+    has_plus = '+' in code
+
+    # AST state: nodes are stored as parallel label/parent lists, index 0 is the root
+    ast = {'labels': ['Root'], 'parents': [-1]}
+    labels = ast['labels']
+    parents = ast['parents']
+    current_node = 0
+    node_stack = []
+
+    # Summary state
+    class_name = None
+    has_main = has_loop = has_if = has_println = False
+    has_for_block = has_try = has_catch = False
+    methods = []
+    variables = []
+    loops = 0
 
-    for line in lines:
+    for line in code.splitlines():
         stripped = line.strip()
+        tokens.extend(line.split())
+        # Loop keywords drive the AST, summary and complexity alike
+        line_loops = LOOP_PATTERN.findall(line)
 
+        # AST nodes
         if stripped.startswith("public class"):
-            class_name = stripped.split(" ")[-1]
-            class_node = {'data': f'Class: {class_name}', 'children': []}
-            current_node['children'].append(class_node)
-            stack.append(current_node)
-            current_node = class_node
+            labels.append(f'Class: {stripped.split(" ")[-1]}')
+            parents.append(current_node)
+            node_stack.append(current_node)
+            current_node = len(labels) - 1
 
         elif stripped.startswith("public static void main"):
-            main_node = {'data': 'Method: main', 'children': []}
-            current_node['children'].append(main_node)
-            stack.append(current_node)
-            current_node = main_node
+            labels.append('Method: main')
+            parents.append(current_node)
+            node_stack.append(current_node)
+            current_node = len(labels) - 1
 
-        elif "for" in stripped or "while" in stripped:
-            loop_node = {'data': 'Loop', 'children': []}
-            current_node['children'].append(loop_node)
-            stack.append(current_node)
-            current_node = loop_node
+        elif line_loops:
+            labels.append('Loop')
+            parents.append(current_node)
+            node_stack.append(current_node)
+            current_node = len(labels) - 1
 
         elif stripped.startswith(("int", "String", "float", "double")):
             var_name = stripped.split()[1].replace(";", "").replace("=", "")
-            var_node = {'data': f'Variable: {var_name}', 'children': []}
-            current_node['children'].append(var_node)
+            labels.append(f'Variable: {var_name}')
+            parents.append(current_node)
 
         elif stripped.startswith("System.out.println"):
-            print_node = {'data': 'Print Statement', 'children': []}
-            current_node['children'].append(print_node)
-
-        if stripped.endswith("}") and stack:
-            current_node = stack.pop()
-
-    return ast
-
-# ---------- AST to Graphviz ----------
-def ast_to_graphviz(ast):
-    dot = Digraph(comment='AST')
-
-    def add_node(node, parent=None):
-        node_name = f"{node['data']}_{id(node)}"
-        dot.node(node_name, node['data'])
-        if parent:
-            dot.edge(parent, node_name)
-
-        for child in node.get('children', []):
-            add_node(child, node_name)
-
-    add_node(ast)
-    dot.attr(dpi='300', size='10,10')
-    return dot
-
-# ---------- Code Summary + Suggestions ----------
-def analyze_code_summary(code):
+            labels.append('Print Statement')
+            parents.append(current_node)
+
+        if stripped.endswith("}") and node_stack:
+            current_node = node_stack.pop()
+
+        # Summary features
+        if class_name is None and "class " in line:
+            class_name = line.split("class ")[1].split("{")[0].strip()
+        if "public static void main" in line:
+            has_main = True
+
+        if stripped.startswith("public") and "(" in line and ")" in line and "class" not in line:
+            methods.append(line.split("(")[0].split()[-1])
+        if stripped.startswith(("int ", "String ", "float ", "double ")):
+            variables.append(stripped.split()[1].replace(";", "").replace("=", ""))
+
+        if line_loops:
+            loops += len(line_loops)
+            has_loop = True
+            if "for" in line_loops and "{" in line:
+                has_for_block = True
+        if "if" in line:
+            has_if = True
+        if "System.out.println" in line:
+            has_println = True
+        if "try" in line:
+            has_try = True
+        if "catch" in line:
+            has_catch = True
+
+    # Lexical results
+    token_count = dict(Counter(tokens))
+    # Classify each distinct token once; repeated tokens reuse the verdict
+    invalid = {
+        token for token in token_count
+        if not token.isalnum() and token not in VALID_OPERATORS
+    }
+    invalid_tokens = [token for token in tokens if token in invalid] if invalid else []
+
+    # Syntax results
+    if not has_semicolon:
+        syntax_errors.append("Missing semicolon in the code.")
+
+    # Summary + Suggestions
     summary = []
     suggestions = []
 
-    if "class " in code:
-        class_name = code.split("class ")[1].split("{")[0].strip()
+    if class_name is not None:
         summary.append(f"This code defines a class named '{class_name}'.")
-
-    if "public static void main" in code:
+    if has_main:
         summary.append("This program contains a main method, which is the entry point of the program.")
-
-    methods = []
-    for line in code.splitlines():
-        if line.strip().startswith("public") and "(" in line and ")" in line and "class" not in line:
-            method_name = line.split("(")[0].split()[-1]
-            methods.append(method_name)
     if methods:
         summary.append(f"The program defines the following methods: {', '.join(methods)}.")
-
-    variables = []
-    for line in code.splitlines():
-        line = line.strip()
-        if line.startswith(("int ", "String ", "float ", "double ")):
-            var_def = line.split()[1].replace(";", "").replace("=", "")
-            variables.append(var_def)
     if variables:
         summary.append(f"The program declares the following variables: {', '.join(variables)}.")
-
-    if "for" in code or "while" in code:
+    if has_loop:
         summary.append("The program uses loops to iterate over data.")
-    if "if" in code:
+    if has_if:
         summary.append("The program uses conditional statements (e.g., 'if' statements) for decision-making.")
-    if "System.out.println" in code:
+    if has_println:
         summary.append("The program contains print statements to display the output.")
 
-    # Suggestions
-    if any("for" in line and "{" in line for line in code.splitlines()):
+    if has_for_block:
         suggestions.append("Consider refactoring to reduce excessive nesting.")
         suggestions.append("Consider using enhanced for-loop syntax where possible for better readability.")
-    if "+" in code and "System.out.println" in code:
+    if has_plus and has_println:
         suggestions.append("Avoid using '+' for string concatenation inside loops. Use StringBuilder for better performance.")
-    if "try" not in code and "catch" not in code:
+    if not has_try and not has_catch:
         suggestions.append("Add proper exception handling with meaningful error messages.")
     suggestions.append("Consider breaking large methods into smaller, more manageable ones.")
 
-    return summary, suggestions
+    return AnalysisResult(
+        token_count=token_count,
+        invalid_tokens=invalid_tokens,
+        syntax_result="Incorrect" if syntax_errors else "Correct",
+        syntax_errors=syntax_errors,
+        ast=ast,
+        summary=summary,
+        suggestions=suggestions,
+        time_complexity=estimate_time_complexity(loops),
+    )
+
+# Analysis is a pure function of the source, so re-running unchanged code is a
+# cache hit. Results are shared between requests and must not be mutated.
+@lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def analyze_cached(code):
+    return analyze_all(code)
+
+def analyze_source(code):
+    if len(code) <= ANALYSIS_CACHE_MAX_LENGTH:
+        return analyze_cached(code)
+    return analyze_all(code)
+
+# ---------- Execute Java Code ----------
+def execute_java_code(java_code, file_name="Main"):
+    # A private directory per request, so concurrent runs never share Main.java
+    work_dir = tempfile.mkdtemp(prefix="javex_", dir=SCRATCH_DIR)
+    java_file = f"{file_name}.java"
+
+    try:
+        with open(os.path.join(work_dir, java_file), "w") as f:
+            f.write(java_code)
+
+        try:
+            compile_result = subprocess.run(
+                ["javac", *JAVAC_FLAGS, "-d", work_dir, java_file],
+                stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                cwd=work_dir, timeout=COMPILE_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            return "Compilation Error", f"Compilation exceeded {COMPILE_TIMEOUT} seconds and was stopped."
+        if compile_result.returncode != 0:
+            return "Compilation Error", compile_result.stderr
+
+        try:
+            # No stdin, so programs reading input fail fast instead of hanging
+            run_result = subprocess.run(
+                ["java", *JVM_FLAGS, "-cp", work_dir, file_name],
+                stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                cwd=work_dir, timeout=JAVA_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            return "Timed Out", f"Execution exceeded {JAVA_TIMEOUT} seconds and was stopped."
+
+        if run_result.returncode != 0:
+            return "Runtime Error", run_result.stderr
+
+        return "Execution Success", run_result.stdout
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# ---------- AST to Graphviz ----------
+def ast_to_graphviz(ast):
+    # Build the DOT source directly from the label/parent lists
+    parts = ['// AST\n', 'digraph {\n', '\tgraph [size="10,10"]\n']
+
+    for node_id, (label, parent_id) in enumerate(zip(ast['labels'], ast['parents'])):
+        label = label.replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'\t{node_id} [label="{label}"]\n')
+        if parent_id >= 0:
+            parts.append(f'\t{parent_id} -> {node_id}\n')
+
+    parts.append('}\n')
+    return Source("".join(parts))
+
+# ---------- Render AST Image ----------
+def source_hash(code):
+    return hashlib.blake2b(code.encode(), digest_size=8).hexdigest()
+
+def render_ast(code_hash, ast, image_format="svg"):
+    # Images are keyed by content, so resubmitting the same code reuses the file
+    filename = f"ast_{code_hash}.{image_format}"
+    filepath = os.path.join(app.static_folder, filename)
+    if not os.path.exists(filepath):
+        image = ast_to_graphviz(ast).pipe(format=image_format)
+        # Write under a private name first so concurrent renders of the same
+        # code never expose a partially written image
+        with tempfile.NamedTemporaryFile(dir=app.static_folder, suffix=".tmp", delete=False) as f:
+            f.write(image)
+        os.replace(f.name, filepath)
+    return filename
+
+def remember_ast(code_hash, ast):
+    with RECENT_ASTS_LOCK:
+        RECENT_ASTS[code_hash] = ast
+        RECENT_ASTS.move_to_end(code_hash)
+        total_nodes = sum(len(kept['labels']) for kept in RECENT_ASTS.values())
+        # Evict oldest first, but always keep the AST just added
+        while len(RECENT_ASTS) > 1 and (len(RECENT_ASTS) > RECENT_ASTS_LIMIT or total_nodes > RECENT_ASTS_MAX_NODES):
+            _, evicted = RECENT_ASTS.popitem(last=False)
+            total_nodes -= len(evicted['labels'])
 
 # ---------- Time Complexity Estimation ----------
-def estimate_time_complexity(code):
-    loops = code.count("for") + code.count("while")
+def estimate_time_complexity(loops):
     if loops == 0:
         return "O(1)"
     elif loops == 1:
@@ -198,56 +359,76 @@ def estimate_time_complexity(code):
 def index():
     return send_from_directory(".", "index.html")
 
+@app.errorhandler(413)
+def code_too_large(error):
+    # JSON, so the page can show the reason instead of a bare status code
+    message = f"Code is too large: the limit is {MAX_CODE_LENGTH} characters."
+    return Response(orjson.dumps({"error": message}), status=413, mimetype="application/json")
+
+@app.errorhandler(400)
+def bad_request(error):
+    return Response(orjson.dumps({"error": error.description}), status=400, mimetype="application/json")
+
 @app.route("/compile_and_run", methods=["POST"])
 def compile_and_run():
     data = request.json
     java_code = data.get("code", "")
+    if len(java_code) > MAX_CODE_LENGTH:
+        abort(413)
+    if SURROGATE_PATTERN.search(java_code):
+        abort(400, description="Code contains invalid characters (unpaired surrogates).")
 
-    # Lexical Analysis
-    token_count, invalid_tokens, lexical_time = lexical_analysis(java_code)
+    # Lexical + Syntax + AST + Summary analysis (timed here, so cache hits
+    # report the time actually spent)
+    start_time = time.time()
+    result = analyze_source(java_code)
+    analysis_time = time.time() - start_time
 
-    # Syntax Analysis
-    syntax_result, syntax_errors, syntax_time = syntax_analysis(java_code)
+    # AST is drawn client-side; keep it around for the image download route
+    code_hash = source_hash(java_code)
+    remember_ast(code_hash, result.ast)
 
     # Execution
-    if syntax_result == "Correct":
+    if result.syntax_result == "Correct":
         execution_status, execution_output = execute_java_code(java_code)
     else:
-        execution_status, execution_output = "Incorrect Syntax", "\n".join(syntax_errors)
-
-    # AST
-    ast = generate_ast(java_code)
-    dot = ast_to_graphviz(ast)
-    # ✅ Generate unique filename (without .png)
-    filename = f"ast_{int(time.time())}"
-    filepath = os.path.join("static", filename)
-    # ✅ Graphviz will add .png automatically
-    dot.render(filepath, format="png", cleanup=True)
-    # Later when returning response, make sure:
-    # "ast_image": filename + ".png"
-
-
-    # Summary + Suggestions + Complexity
-    summary, suggestions = analyze_code_summary(java_code)
-    complexity = estimate_time_complexity(java_code)
-
-    # Render AST and prepare filename
-    output_path = dot.render(filepath, format="png", cleanup=True)
-    ast_filename = os.path.basename(output_path)   # e.g. "ast_1756712118.png"
-    return jsonify({
+        execution_status, execution_output = "Incorrect Syntax", "\n".join(result.syntax_errors)
+
+    # orjson serializes the token counts and AST in C, well ahead of jsonify.
+    # It rejects unpaired surrogates, which is why such code is refused above.
+    return Response(orjson.dumps({
         "execution_status": execution_status,
         "execution_output": execution_output,
-        "lexical": token_count,
-        "invalid_tokens": invalid_tokens,
-        "lexical_time": round(lexical_time, 4),
-        "syntax_result": syntax_result,
-        "syntax_errors": syntax_errors,
-        "syntax_time": round(syntax_time, 4),
-        "time_complexity": complexity,
-        "summary": summary,
-        "suggestions": suggestions,
-        "ast_image": ast_filename
-    })
+        "lexical": result.token_count,
+        "invalid_tokens": result.invalid_tokens,
+        "analysis_time": round(analysis_time, 4),
+        "syntax_result": result.syntax_result,
+        "syntax_errors": result.syntax_errors,
+        "time_complexity": result.time_complexity,
+        "summary": result.summary,
+        "suggestions": result.suggestions,
+        "ast": result.ast,
+        "ast_hash": code_hash
+    }), mimetype="application/json")
+
+@app.route("/render_ast")
+def render_ast_image():
+    code_hash = request.args.get("hash", "")
+    image_format = request.args.get("format", "svg")
+    if image_format not in AST_IMAGE_FORMATS:
+        abort(400)
+    if not SOURCE_HASH_PATTERN.fullmatch(code_hash):
+        abort(404)
+
+    with RECENT_ASTS_LOCK:
+        ast = RECENT_ASTS.get(code_hash)
+    if ast is None and not os.path.exists(os.path.join(app.static_folder, f"ast_{code_hash}.{image_format}")):
+        abort(404)
+
+    return send_from_directory(
+        app.static_folder, render_ast(code_hash, ast, image_format),
+        as_attachment=True, download_name=f"ast.{image_format}",
+    )
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))  # Railway/Heroku gives PORT, default 5000 for local
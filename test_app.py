@@ -0,0 +1,21 @@
+import unittest
+
+from app import app
+
+
+class CompileAndRunTest(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_unpaired_surrogate_is_rejected_with_json_400(self):
+        response = self.client.post(
+            "/compile_and_run",
+            data=b'{"code": "int x = \\ud800 ( "}',
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.get_json())
+
+
+if __name__ == "__main__":
+    unittest.main()